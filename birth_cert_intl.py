@@ -1,41 +1,61 @@
 import os, re
 from io import BytesIO
-import boto3, streamlit as st
-import zipfile
+import streamlit as st
 from dotenv import load_dotenv
-from docx.shared import Pt, RGBColor
-from docx.oxml.ns import qn
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.enum.table import WD_ALIGN_VERTICAL
-from docx import Document
-from io import BytesIO
 from datetime import datetime
-from docx.shared import Cm
-from docx.shared import Mm
-import tempfile, os
+from xml.sax.saxutils import escape as xml_escape
+import tempfile
+import threading, subprocess, shutil, signal
+from concurrent.futures import ThreadPoolExecutor, as_completed
+# boto3, zipfile and python-docx are imported where they're used, so the
+# password page doesn't pay for them on every rerun
 
 # ── AWS / ENV ───────────────────────────────────────────────────────────────
 load_dotenv()
-textract = boto3.client(
-    "textract",
-    aws_access_key_id     = os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name           = os.getenv("AWS_REGION") or "us-east-2"
-)
 
-# ── STREAMLIT UI ────────────────────────────────────────────────────────────
-st.set_page_config(page_title="Lindje Internacionale", layout="centered")
-st.title("Certifikata Lindje Internacionale\nShqip - Italisht")
-st.markdown("Ngarko nje ose me shume certifikata lindje internacionale dhe shkarko versionin italisht DOCX.")
+@st.cache_resource
+def get_textract():
+    import boto3
+    from botocore.config import Config
+
+    # one client (and HTTPS pool) shared by every session and rerun;
+    # the pool is sized above the default 10 for the multi-file thread pool
+    return boto3.client(
+        "textract",
+        aws_access_key_id     = os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name           = os.getenv("AWS_REGION") or "us-east-2",
+        config                = Config(
+            max_pool_connections = 16,
+            retries              = {"max_attempts": 3, "mode": "adaptive"},
+        ),
+    )
 
-uploaded_files = st.file_uploader("Ngarko certifikata", type=["pdf", "jpg", "jpeg", "png"], accept_multiple_files=True)
-download_format = st.selectbox("Output format", ["Word (.docx)", "PDF (.pdf)"])
+@st.cache_resource
+def _textract_slots():
+    # cap concurrent Textract requests so batches stay under the AWS TPS limit;
+    # cached so the cap is shared by every session and rerun, like the client
+    return threading.BoundedSemaphore(3)
 
-import streamlit as st
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def analyze(doc_bytes: bytes) -> dict:
+    """
+    Textract response for the given file bytes. Cached on the content, so
+    reruns (password retype, format toggle, ...) don't pay for OCR again.
+    """
+    with _textract_slots():
+        return get_textract().analyze_document(
+            Document={'Bytes': doc_bytes},
+            FeatureTypes=["TABLES"]     # WORD/LINE blocks come with every response
+        )
 
-st.title("Perkthimi i Certifikates")
+# ── STREAMLIT UI ────────────────────────────────────────────────────────────
+if "page_cfg" not in st.session_state:
+    st.set_page_config(page_title="Lindje Internacionale", layout="centered")
+    st.session_state.page_cfg = True
 
 # --- Simple password gate (one shared password) ---
+# checked before the uploader so nothing is uploaded for unauthenticated visitors
 password = st.text_input("Password", type="password")
 if "APP_PASSWORD" not in st.secrets:
     st.stop()  # safety if not configured
@@ -44,9 +64,36 @@ if password != st.secrets["APP_PASSWORD"]:
     st.stop()
 # ---------------------------------------------------
 
+st.title("Certifikata Lindje Internacionale\nShqip - Italisht")
+st.markdown("Ngarko nje ose me shume certifikata lindje internacionale dhe shkarko versionin italisht DOCX.")
+
+uploaded_files = st.file_uploader("Ngarko certifikata", type=["pdf", "jpg", "jpeg", "png"], accept_multiple_files=True)
+download_format = st.selectbox("Output format", ["Word (.docx)", "PDF (.pdf)"])
+
+
+# ── HELPER: one pass over the Textract blocks ───────────────────────────────
+def index_blocks(blocks):
+    """
+    Splits the Textract blocks by type in a single pass so the helpers
+    below don't each rescan the full list.
+    Returns (words, lines, tables, bmap); `lines` holds the LINE texts.
+    """
+    bmap = {}
+    words, lines, tables = [], [], []
+    for b in blocks:
+        bmap[b["Id"]] = b
+        t = b["BlockType"]
+        if t == "WORD":
+            words.append(b)
+        elif t == "LINE":
+            lines.append(b["Text"])
+        elif t == "TABLE":
+            tables.append(b)
+    return words, lines, tables, bmap
+
 
 # ── HELPER: Stato Civile from vertical checkboxes ───────────────────────────
-def get_stato_from_vertical_boxes(blocks, bmap, gender=""):
+def get_stato_from_vertical_boxes(words, gender=""):
     """
     Detects civil-status for the Albanian birth-certificate template.
 
@@ -63,50 +110,44 @@ def get_stato_from_vertical_boxes(blocks, bmap, gender=""):
     `gender` should be the already-extracted "Maschile" or “Femminile”.
     """
 
-    fragments = [
-        ("beqar",   0),   # index 0
-        ("martu",   1),   # index 1
-        ("shkuror", 2),   # index 2
-        ("vedov",   3)    # index 3  (matches vedovo / vedova / vedov…)
-    ]
+    fragments = {
+        "beqar":   0,
+        "martu":   1,
+        "shkuror": 2,
+        "vedov":   3,     # matches vedovo / vedova / vedov…
+    }
 
     male   = ["Celibe",  "Coniugato",  "Divorziato", "Vedovo"]
     female = ["Nubile",  "Coniugata",  "Divorziata", "Vedova"]
 
-    # ── 1. locate first WORD for each fragment and store its Y-centre
+    # ── 1. one pass: Y-centre of the first WORD per fragment + the handwritten “x”
     centres = {}          # index → y
-    for w in blocks:
-        if w["BlockType"] != "WORD":
-            continue
+    targets_left = set(fragments)
+    x_block = None
+    for w in words:
         text_low = w["Text"].strip().lower()
-        for frag, idx in fragments:
-            if frag in text_low and idx not in centres:
-                bb = w["Geometry"]["BoundingBox"]
-                centres[idx] = bb["Top"] + bb["Height"]/2
-
-    if len(centres) < 4:
-        return "[X] Stato non riconosciuto"
-
-    # sort indices by Y
-    ordered = sorted(centres.items(), key=lambda p: p[1])   # [(idx, y), …]
+        if x_block is None and text_low in ("x", "x.", "x,"):
+            x_block = w
+        else:
+            for frag in tuple(targets_left):
+                if frag in text_low:
+                    bb = w["Geometry"]["BoundingBox"]
+                    centres[fragments[frag]] = bb["Top"] + bb["Height"]/2
+                    targets_left.discard(frag)
+                    break
+        if not targets_left and x_block:
+            break
 
-    # ── 2. find the handwritten “x”
-    x_block = next(
-        (w for w in blocks
-         if w["BlockType"] == "WORD"
-            and w["Text"].strip().lower() in ("x", "x.", "x,")),
-        None
-    )
-    if not x_block:
+    if len(centres) < 4 or not x_block:
         return "[X] Stato non riconosciuto"
 
     bbx = x_block["Geometry"]["BoundingBox"]
     x_centre_y = bbx["Top"] + bbx["Height"]/2
 
-    # ── 3. choose the label whose centre-Y is nearest to the X
-    best_idx, _ = min(ordered, key=lambda p: abs(p[1] - x_centre_y))
+    # ── 2. choose the label whose centre-Y is nearest to the X
+    best_idx = min(centres, key=lambda i: abs(centres[i] - x_centre_y))
 
-    # ── 4. return gender-specific Italian form
+    # ── 3. return gender-specific Italian form
     g = (gender or "").lower()
     if g.startswith("f"):        # femminile
         return female[best_idx]
@@ -117,6 +158,37 @@ def get_stato_from_vertical_boxes(blocks, bmap, gender=""):
 
 
 # __ HELPER: Word to PDF
+# LibreOffice limits. A headless Writer instance takes roughly 200-300 MB RSS,
+# and a first start on a fresh profile can take several seconds. Streamlit
+# Community Cloud gives an app at most 2.7 GB RAM and 2 CPU cores, so two
+# instances (~0.6 GB) leave room for the app and its uploads; more wouldn't
+# convert faster on two cores anyway.
+LIBREOFFICE_WORKERS = 2
+# per-call timeout in seconds: startup allowance + conversion time per file
+LIBREOFFICE_TIMEOUT = 60
+LIBREOFFICE_TIMEOUT_PER_FILE = 15
+
+
+def _run_libreoffice(cmd, n_files):
+    """
+    Runs a LibreOffice command and returns its exit code. It gets its own
+    session, so on timeout the kill also reaches the soffice.bin child that
+    the `libreoffice` launcher script spawns; subprocess.TimeoutExpired is
+    then re-raised.
+    """
+    proc = subprocess.Popen(cmd, start_new_session=True)
+    try:
+        return proc.wait(timeout=LIBREOFFICE_TIMEOUT
+                         + LIBREOFFICE_TIMEOUT_PER_FILE * n_files)
+    except subprocess.TimeoutExpired:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+        proc.wait()
+        raise
+
+
 def docx_bytes_to_pdf_bytes(docx_bytes: bytes) -> bytes:
     """
     Converts an in-memory DOCX (bytes) to PDF (bytes) using docx2pdf first.
@@ -136,21 +208,115 @@ def docx_bytes_to_pdf_bytes(docx_bytes: bytes) -> bytes:
             convert(docx_path, pdf_path)       # ← create PDF
         except Exception:
             # fallback: LibreOffice (works headless everywhere)
-            import subprocess, shlex
-            cmd = f'libreoffice --headless --convert-to pdf --outdir "{tmp}" "{docx_path}"'
-            subprocess.run(shlex.split(cmd), check=True)
+            cmd = ["libreoffice", "--headless", "--convert-to", "pdf", "--outdir", tmp, docx_path]
+            code = _run_libreoffice(cmd, 1)      # raises TimeoutExpired if it hangs
+            if code:
+                raise subprocess.CalledProcessError(code, cmd)
 
         # read PDF back into memory
         with open(pdf_path, "rb") as f:
             return f.read()
 
 
-# ── HELPER: Get Seal Block (last 2 lines) ────────────────────────────────────
-def extract_seal_footer(blocks):
-    import re
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+def render_output(docx_bytes: bytes, fmt: str):
+    """
+    Returns (bytes, mime, ext) for the selected output format.
+    LibreOffice / docx2pdf only run when PDF was actually requested.
+    """
+    if fmt.startswith("PDF"):
+        return docx_bytes_to_pdf_bytes(docx_bytes), "application/pdf", "pdf"
+    return docx_bytes, DOCX_MIME, "docx"
+
+
+def docx_batch_to_pdf_bytes(docx_bytes_list, profile_dir=None):
+    """
+    Converts several in-memory DOCX files with ONE LibreOffice invocation,
+    so the (slow) startup is paid once per batch instead of once per file.
+    Returns the PDF bytes in the same order, None for a file that didn't convert.
+    `profile_dir` gives the process a private user profile (see below).
+    Without LibreOffice, falls back to docx_bytes_to_pdf_bytes (docx2pdf) per file.
+    """
+    if not docx_bytes_list:
+        return []
+
+    if shutil.which("libreoffice") is None:
+        pdfs = []
+        for docx_bytes in docx_bytes_list:
+            try:
+                pdfs.append(docx_bytes_to_pdf_bytes(docx_bytes))
+            except Exception:
+                pdfs.append(None)
+        return pdfs
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, docx_bytes in enumerate(docx_bytes_list):
+            path = os.path.join(tmp, f"doc_{i}.docx")
+            with open(path, "wb") as f:
+                f.write(docx_bytes)
+            paths.append(path)
+
+        cmd = ["libreoffice", "--headless"]
+        if profile_dir:
+            cmd.append("-env:UserInstallation=file://" + profile_dir)
+        cmd += ["--convert-to", "pdf", "--outdir", tmp, *paths]
+        # LibreOffice exits 0 even when single inputs fail → check each output.
+        # A hung instance (e.g. stuck initialising its profile) is killed and
+        # the whole chunk counts as not converted.
+        try:
+            _run_libreoffice(cmd, len(paths))
+        except subprocess.TimeoutExpired:
+            return [None] * len(paths)
+
+        pdfs = []
+        for i in range(len(paths)):
+            pdf_path = os.path.join(tmp, f"doc_{i}.pdf")
+            if not os.path.exists(pdf_path):
+                pdfs.append(None)
+                continue
+            with open(pdf_path, "rb") as f:
+                pdfs.append(f.read())
+        return pdfs
+
+
+def docx_batch_to_pdf_batch(items, workers=LIBREOFFICE_WORKERS):
+    """
+    Converts [(fname, docx_bytes), ...] to [(fname, pdf_bytes), ...], same order;
+    pdf_bytes is None for the files that failed to convert.
+    The batch is split into up to `workers` chunks, each converted by its own
+    LibreOffice process in a single call. Every process gets its own user
+    profile: LibreOffice refuses to run two instances on one profile, which
+    is what serialises naive parallel calls.
+    """
+    if not items:
+        return []
+    workers = max(1, min(workers, len(items)))
+    chunks = [items[i::workers] for i in range(workers)]
 
-    lines = [b["Text"] for b in blocks if b["BlockType"] == "LINE"]
+    with tempfile.TemporaryDirectory() as tmp:
+        def convert_chunk(i):
+            profile_dir = os.path.join(tmp, f"profile_{i}")
+            return docx_batch_to_pdf_bytes([d for _, d in chunks[i]], profile_dir)
+
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            converted = list(ex.map(convert_chunk, range(workers)))
+
+    # undo the round-robin split
+    out = [None] * len(items)
+    for i, pdfs in enumerate(converted):
+        for j, pdf in enumerate(pdfs):
+            out[i + j * workers] = (items[i + j * workers][0], pdf)
+    return out
+
+
+# ── HELPER: Get Seal Block (last 2 lines) ────────────────────────────────────
+_DATE_RE  = re.compile(r"\d{4}/\d{2}/\d{2}")
+_HASH_RE  = re.compile(r"[A-Fa-f0-9]{30,40}")
+_DATE_PFX = re.compile(r"^(Date|Datë)\s*:?\s*", re.I)
 
+def extract_seal_footer(lines):
     # locate the *second* “Vulosur elektronikisht …”
     matches = [i for i, t in enumerate(lines)
                if "vulosur elektronikisht" in t.lower()]
@@ -165,13 +331,13 @@ def extract_seal_footer(blocks):
         txt = raw.strip()
 
         # ── grab the date line ──────────────────────────────────────────────
-        if not date_line and re.search(r"\d{4}/\d{2}/\d{2}", txt):
+        if not date_line and _DATE_RE.search(txt):
             # remove any leading “Date”, “Datë”, “Date:”, “Datë:” etc.
-            txt = re.sub(r"^(Date|Datë)\s*:?\s*", "", txt, flags=re.I).strip()
+            txt = _DATE_PFX.sub("", txt).strip()
             date_line = f"In data {txt}"          # ← Italian label
 
         # ── grab the hash line ──────────────────────────────────────────────
-        elif not hash_line and re.fullmatch(r"[A-Fa-f0-9]{30,40}", txt):
+        elif not hash_line and _HASH_RE.fullmatch(txt):
             hash_line = txt
 
         if date_line and hash_line:
@@ -189,25 +355,41 @@ def extract_seal_footer(blocks):
 
 
 # ── HELPER: Albanian→Italian place exonyms ──────────────────────────────────
-EXONYM_RULES = [
+EXONYM_RULES = [(re.compile(pat, re.IGNORECASE), repl) for pat, repl in [
     (r"\bTiran[ëe]\b",   "Tirana"),
     (r"\bVlor[ëe]\b",    "Valona"),
     (r"\bDurr[ëe]s\b",   "Durazzo"),
     (r"\bShkod[ëe]r\b",  "Scutari"),
-]
+]]
 
 def map_exonyms(text: str) -> str:
     if not text:
         return text
     out = text
     for pat, repl in EXONYM_RULES:
-        out = re.sub(pat, repl, out, flags=re.IGNORECASE)
+        out = pat.sub(repl, out)
     return out
 
 
 # ── TABLE-FIELD EXTRACTION ──────────────────────────────────────────────────
-def extract_table_fields(blocks, bmap):
-    tbl = next((b for b in blocks if b["BlockType"] == "TABLE"), None)
+# Residenza abbreviations, rewritten in a single pass over the cell.
+# The short abbreviations are case-sensitive and anchored at a word start,
+# so "Sh.", "Kap.", "Ceh." are left alone; only the long words match in any
+# case (NJËSIA, Njesia, ...) and are looked up by their title-cased form.
+_RES_MAP = {
+    "Nd.":            "Ed.",
+    "H.":             "Int.",
+    "Ap.":            "App.",
+    "Njësia":         "Sezione",
+    "Njesia":         "Sezione",
+    "Administrative": "Amministrativa",
+}
+_RES_RE = re.compile(
+    r"\bNd\.|\bH\.|\bAp\.|(?i:Nj[eë]sia)|(?i:Administrative)"
+)
+
+def extract_table_fields(words, lines, tables, bmap):
+    tbl = tables[0] if tables else None
     if not tbl: return {}
 
     rows = {}
@@ -218,49 +400,45 @@ def extract_table_fields(blocks, bmap):
             if cell["BlockType"] != "CELL": continue
             r,c = cell["RowIndex"], cell["ColumnIndex"]
             txt = " ".join(
-                w["Text"] for cr in cell.get("Relationships", [])
-                for wid in cr.get("Ids", []) for w in (bmap[wid],)
-                if w["BlockType"] == "WORD"
+                bmap[wid]["Text"] for cr in cell.get("Relationships", ())
+                if cr["Type"] == "CHILD"
+                for wid in cr["Ids"] if bmap[wid]["BlockType"] == "WORD"
             ).strip()
             rows.setdefault(r, {})[c] = txt
 
+    # only the value column (2) is read below
+    col2 = {r: cols.get(2, "") for r, cols in rows.items()}
+
     # ---------- ***NEW: clean up row 9 / col 2 abbreviations *** ----------
-    res_raw = rows.get(9, {}).get(2, "")
+    res_raw = col2.get(9, "")
     if res_raw:                                # only touch this one cell
-        res_clean = (
-            re.sub(r"Nd.",  "Ed.",  res_raw)   # Nd.  → Ed.
-            .replace("H.",     "Int.")            # H.   → Int.
-            .replace("Ap.",    "App.")             # Ap.  → App.
-            .replace("Njësia",      "Sezione")
-            .replace("Administrative",      "Amministrativa")
-            .replace("NJËSIA",      "Sezione")
-            .replace("ADMINISTRATIVE",      "Amministrativa")
-            .replace("NJESIA",      "Sezione")
-            .replace("Njesia",      "Sezione")
+        col2[9] = _RES_RE.sub(
+            lambda m: _RES_MAP.get(m.group(0),
+                                   _RES_MAP.get(m.group(0).title(), m.group(0))),
+            res_raw
         )
-        rows[9][2] = res_clean
 
-    sesso_raw = rows.get(10, {}).get(2, "").strip().upper()
+    sesso_raw = col2.get(10, "").strip().upper()
     if   sesso_raw == "M": sesso_val = "Maschile"
     elif sesso_raw == "F": sesso_val = "Femminile"
     else:                  sesso_val = sesso_raw
 
 
     result = {
-        "Nome":              rows.get(2,  {}).get(2,""),
-        "Cognome":           rows.get(3,  {}).get(2,""),
-        "Numero personale":  rows.get(4,  {}).get(2,""),
-        "Nome del padre":    rows.get(5,  {}).get(2,""),
-        "Nome della madre":  rows.get(6,  {}).get(2,""),
-        "Data di nascita":   rows.get(7,  {}).get(2,""),
-        "Luogo di nascita":  rows.get(8,  {}).get(2,""),
-        "Residenza":         rows.get(9,  {}).get(2,""),
+        "Nome":              col2.get(2,""),
+        "Cognome":           col2.get(3,""),
+        "Numero personale":  col2.get(4,""),
+        "Nome del padre":    col2.get(5,""),
+        "Nome della madre":  col2.get(6,""),
+        "Data di nascita":   col2.get(7,""),
+        "Luogo di nascita":  col2.get(8,""),
+        "Residenza":         col2.get(9,""),
         "Sesso":             sesso_val,
-        "Stato Civile":      get_stato_from_vertical_boxes(blocks, bmap, sesso_val),
-        "Cittadinanza":      rows.get(12, {}).get(2,""),
-        "Cognome prima del matrimonio": rows.get(13, {}).get(2,""),
-        "Data del rilascio": rows.get(14, {}).get(2,""),
-        "ElectronicSeal":    extract_seal_footer(blocks),
+        "Stato Civile":      get_stato_from_vertical_boxes(words, sesso_val),
+        "Cittadinanza":      col2.get(12,""),
+        "Cognome prima del matrimonio": col2.get(13,""),
+        "Data del rilascio": col2.get(14,""),
+        "ElectronicSeal":    extract_seal_footer(lines),
     }
 
     # Normalize place names
@@ -274,18 +452,27 @@ def extract_table_fields(blocks, bmap):
     return result
 
 # ── HEADER (Comune / Sezione) ───────────────────────────────────────────────
-def extract_comune_sezione(blocks):
-    lines = [b["Text"] for b in blocks if b["BlockType"] == "LINE"]
+# Bashkia <comune> | Njësia Administrative <sezione>; a bare "Nr." suffix
+# continues on the next line, which the \s* after it picks up. The sezione
+# stops before a following "Bashkia", since Textract can merge both header
+# columns into one LINE.
+_HDR_RE = re.compile(
+    r"Bashkia[ \t]+(?P<com>[A-ZÇËA-Za-zë\-]+)"
+    r"|Nj[eë]sia[ \t]+Administrative[ \t]+"
+    r"(?P<sez>(?:Nr\.?\s*)?(?!Bashkia\b)\S(?:(?!\s+Bashkia\b).)*)",
+    re.IGNORECASE
+)
+
+def extract_comune_sezione(lines):
     comune = sezione = ""
-    for i,l in enumerate(lines):
-        if "Bashkia" in l:
-            m = re.search(r"Bashkia\s+([A-ZÇËA-Za-zë\-]+)", l)
-            if m: comune = m.group(1).title()
-        if "Njësia Administrative" in l or "Njesia Administrative" in l:
-            suf = l.split("Administrative",1)[1].strip()
-            if suf.lower() in ("nr.","nr"):
-                suf = suf + " " + (lines[i+1] if i+1 < len(lines) else "")
-            sezione = suf.title()
+    # single scan over the header text; the last match of each field wins
+    for m in _HDR_RE.finditer("\n".join(lines)):
+        if m.group("com"):
+            comune = m.group("com")
+        else:
+            sezione = " ".join(m.group("sez").split())
+    comune = comune.title()
+    sezione = sezione.title()
     # normalize Comune
     comune = map_exonyms(comune)
     sezione = map_exonyms(sezione)
@@ -294,7 +481,61 @@ def extract_comune_sezione(blocks):
 
 
 # ── DOCX TEMPLATE ───────────────────────────────────────────────────────────
+# One details-table row: label (left) | value (centred), both vertically
+# centred, 5pt before/after, single line spacing. Widths are in twips.
+_CELL_XML = (
+    '<w:tc><w:tcPr><w:tcW w:w="{w}" w:type="dxa"/>{span}<w:vAlign w:val="center"/></w:tcPr>'
+    '<w:p><w:pPr><w:spacing w:before="{space}" w:after="{space}" w:line="240" w:lineRule="auto"/>'
+    '<w:jc w:val="{jc}"/></w:pPr>'
+    '<w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p></w:tc>'
+)
+ROW_TEMPLATE = "<w:tr>{left}{right}</w:tr>".format(
+    left  = _CELL_XML.format(w="{lw}", span="", space=100, jc="left",   text="{label}"),
+    right = _CELL_XML.format(w="{rw}", span="", space=100, jc="center", text="{value}"),
+)
+# merged row across both columns (17pt = 5pt + one blank line above/below)
+SPAN_ROW_TEMPLATE = "<w:tr>{}</w:tr>".format(
+    _CELL_XML.format(w="{w}", span='<w:gridSpan w:val="2"/>', space=340, jc="left", text="{text}")
+)
+
+@st.cache_resource
+def _read_image(path):
+    # shared by every session and rerun → the flag is read once per process
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _flag_bytes():
+    # only an existing file is cached, so a flag added later is still picked up
+    img_path = os.path.join(os.getcwd(), "al_flag.png")
+    if not os.path.exists(img_path):
+        return None
+    return _read_image(img_path)
+
+
+def add_multiline(p, lines, **kw):
+    """
+    Adds `lines` to paragraph `p` as ONE run separated by real <w:br/> breaks
+    (instead of one paragraph per line). `kw` sets run attributes, e.g. bold=True.
+    """
+    r = p.add_run(lines[0])
+    for ln in lines[1:]:
+        r.add_break()
+        r.add_text(ln)
+    for k, v in kw.items():
+        setattr(r, k, v)
+    return r
+
+
 def make_docx(data):
+    from docx import Document
+    from docx.shared import Pt, RGBColor, Cm, Mm
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import qn, nsdecls
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+    from docx.enum.table import WD_ALIGN_VERTICAL
+    from docx.enum.style import WD_STYLE_TYPE
+
     doc = Document()
     today = datetime.today().strftime("%d.%m.%Y")
     section = doc.sections[0]
@@ -314,18 +555,21 @@ def make_docx(data):
     font.color.rgb = RGBColor(0, 0, 0)
     style.element.rPr.rFonts.set(qn('w:eastAsia'), 'Times New Roman')
 
-    def add_paragraph(text, size=11, align="left", bold=False, italic=False, underline=False, indent_cm=0):
-        p = doc.add_paragraph()
-        run = p.add_run(text)
-        run.font.name = 'Times New Roman'
-        run.font.size = Pt(size)
-        run.bold = bold
-        run.italic = italic
-        run.underline = underline
-        run.font.color.rgb = RGBColor(0, 0, 0)
-
-        p.paragraph_format.space_before = Pt(0)
-        p.paragraph_format.space_after = Pt(0)
+    # 10pt blocks get their own style instead of per-run font overrides;
+    # runs inherit everything else from Normal
+    small = doc.styles.add_style("Small", WD_STYLE_TYPE.PARAGRAPH)
+    small.base_style = style
+    small.font.size = Pt(10)
+
+    def add_paragraph(text, size=11, align="left", bold=False, italic=False, underline=False, indent_cm=0,
+                      space_before=0, space_after=0):
+        p = doc.add_paragraph(style=small if size == 10 else None)
+        run = add_multiline(p, text.split("\n"), bold=bold, italic=italic, underline=underline)
+        if size not in (10, 11):
+            run.font.size = Pt(size)
+
+        p.paragraph_format.space_before = Pt(space_before)
+        p.paragraph_format.space_after = Pt(space_after)
         p.paragraph_format.line_spacing = 1
 
         if indent_cm > 0:
@@ -362,19 +606,23 @@ def make_docx(data):
     # left header cell
     cell1 = row.cells[0]
     p1 = cell1.paragraphs[0]
-    
-    # add an empty line first
-    p1.add_run("\n")
 
-    img_path = os.path.join(os.getcwd(), "al_flag.png")
-    if os.path.exists(img_path):
+    # one empty line above the flag, and around the country name
+    p1.paragraph_format.space_before = Pt(12)
+    p1.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+
+    flag = _flag_bytes()
+    if flag:
         r = p1.add_run()
-        r.add_picture(img_path, width=Cm(0.7))
-    r = p1.add_run("\n\nREPUBBLICA D'ALBANIA\n")
+        r.add_picture(BytesIO(flag), width=Cm(0.7))
+        p_name = cell1.add_paragraph()
+        p_name.paragraph_format.space_before = Pt(12)
+        p_name.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+    else:
+        p_name = p1
+    p_name.paragraph_format.space_after = Pt(12)
+    r = p_name.add_run("REPUBBLICA D'ALBANIA")
     r.bold = True
-    r.font.name = 'Times New Roman'
-    r.font.size = Pt(11)
-    p1.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
     cell1.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
 
     # right header cell
@@ -382,13 +630,12 @@ def make_docx(data):
     p2 = cell2.paragraphs[0]
     lines = []
     if data.get("Comune"):
-        lines.append(f"\n\nUfficio di Stato Civile Comune di {data['Comune']}")
+        lines.append(f"Ufficio di Stato Civile Comune di {data['Comune']}")
+        p2.paragraph_format.space_before = Pt(24)
     if data.get("Sezione"):
         lines.append(f"Sezione Amministrativa {data['Sezione']}")
-    r = p2.add_run("\n".join(lines))
-    r.bold = True
-    r.font.name = 'Times New Roman'
-    r.font.size = Pt(11)
+    if lines:
+        add_multiline(p2, lines, bold=True)
     p2.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
     cell2.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
     
@@ -397,15 +644,13 @@ def make_docx(data):
     _set_row_widths(row)
     merged = row.cells[0].merge(row.cells[1])
     p = merged.paragraphs[0]
-    run = p.add_run("\nCERTIFICATO DI NASCITA\n")
+    run = p.add_run("CERTIFICATO DI NASCITA")
     run.bold = True
-    run.font.name = "Times New Roman"
-    run.font.size = Pt(11)
 
     p.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
-    p.paragraph_format.space_before = Pt(0)
-    p.paragraph_format.space_after = Pt(0)
+    p.paragraph_format.space_before = Pt(12)
+    p.paragraph_format.space_after = Pt(12)
     p.paragraph_format.line_spacing = 1
 
     fields = [
@@ -422,65 +667,31 @@ def make_docx(data):
         ("Cognome prima del matrimonio",data["Cognome prima del matrimonio"]),
         ("Data del rilascio", data["Data del rilascio"]),
         # 👇 Last row as a special marker
-        ("\nTimbrato elettronicamente dalla Direzione Generale dello Stato Civile\n", None),
+        ("Timbrato elettronicamente dalla Direzione Generale dello Stato Civile", None),
     ]
 
+    # field rows are rendered from ROW_TEMPLATE / SPAN_ROW_TEMPLATE and parsed
+    # in one go, instead of add_row() + per-cell formatting for every row
+    rows_xml = []
     for k, v in fields:
         if v is None:
             # special: merged last row
-            row = tbl.add_row()
-            _set_row_widths(row)
-            merged = row.cells[0].merge(row.cells[1])
-
-            para = merged.paragraphs[0]
-            run = para.add_run(k)
-            run.font.name = 'Times New Roman'
-            run.font.size = Pt(11)
-            run.font.color.rgb = RGBColor(0, 0, 0)
-
-            merged.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-            para.paragraph_format.space_before = Pt(5)
-            para.paragraph_format.space_after = Pt(5)
-            para.paragraph_format.line_spacing = 1
-            para.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
+            rows_xml.append(SPAN_ROW_TEMPLATE.format(
+                w=left_w.twips + right_w.twips, text=xml_escape(k)))
             continue
 
-        # normal two-cell row
-        row = tbl.add_row()
-        _set_row_widths(row)
-        cells = row.cells
-
-        # vertical center left label only (or both if you prefer)
-        cells[0].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-        cells[1].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-
-        # left cell (label)
-        para_left = cells[0].paragraphs[0]
-        run_left = para_left.add_run(k)
-        run_left.font.name = 'Times New Roman'
-        run_left.font.size = Pt(11)
-        run_left.font.color.rgb = RGBColor(0, 0, 0)
-        para_left.paragraph_format.space_before = Pt(5)
-        para_left.paragraph_format.space_after = Pt(5)
-        para_left.paragraph_format.line_spacing = 1
-        para_left.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
-
         # right cell (value)
         if k == "Cognome prima del matrimonio":
             display_val = v.strip() if v and v.strip() else "-------"
         else:
             display_val = v or ""
-        para_right = cells[1].paragraphs[0]
-        run_right = para_right.add_run(display_val)
-        run_right.font.name = 'Times New Roman'
-        run_right.font.size = Pt(11)
-        run_right.font.color.rgb = RGBColor(0, 0, 0)
-        para_right.paragraph_format.space_before = Pt(5)
-        para_right.paragraph_format.space_after = Pt(5)
-        para_right.paragraph_format.line_spacing = 1
-        para_right.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-      
+        rows_xml.append(ROW_TEMPLATE.format(
+            lw=left_w.twips, rw=right_w.twips,
+            label=xml_escape(k), value=xml_escape(display_val)))
+
+    parsed = parse_xml(f"<w:tbl {nsdecls('w')}>{''.join(rows_xml)}</w:tbl>")
+    for tr in list(parsed):
+        tbl._tbl.append(tr)
 
     # Electronic Seal
     if data.get("ElectronicSeal"):
@@ -489,9 +700,9 @@ def make_docx(data):
 
     # Footer sections (size 10)
     add_paragraph(
-        "\nNota: Questo documento è stato generato e timbrato \nda una procedura automatica da un "
-        "sistema elettronico \n(Direzione Generale di Stato Civile)\n", italic=True,
-        size=10
+        "Nota: Questo documento è stato generato e timbrato \nda una procedura automatica da un "
+        "sistema elettronico \n(Direzione Generale di Stato Civile)", italic=True,
+        size=10, space_before=12, space_after=12
     )
     
     table = doc.add_table(rows=1, cols=1)
@@ -502,24 +713,23 @@ def make_docx(data):
     table.rows[0].cells[0].width = Cm(11)  # Redundant but safer for compatibility
 
     cell = table.rows[0].cells[0]
-    p = cell.paragraphs[0]  
-    run = p.add_run(
+    p = cell.paragraphs[0]
+    p.style = small
+    add_multiline(p, [
         "Io, Vjollca META, traduttrice ufficiale della lingua italiana certificata dal Ministero "
         "della Giustizia con il numero di certificato 412 datato 31.07.2024, dichiaro di aver tradotto "
-        "il testo presentatomi dalla lingua albanese all'italiano con precisione e responsabilità legale.\n"
+        "il testo presentatomi dalla lingua albanese all'italiano con precisione e responsabilità legale.",
         f"In data {today}."
-)
-    run.font.name = 'Times New Roman'
-    run.font.size = Pt(10)
-    run.font.color.rgb = RGBColor(0, 0, 0)
+    ])
     p.paragraph_format.space_before = Pt(0)
     p.paragraph_format.space_after = Pt(0)
     p.paragraph_format.line_spacing = 1
     p.alignment = WD_PARAGRAPH_ALIGNMENT.LEFT
 
     add_paragraph(
-        "\n\nTraduzione eseguita da:\nVjollca META",
+        "Traduzione eseguita da:\nVjollca META",
         size=11,
+        space_before=24,
         align="center",
         indent_cm=11
     )
@@ -536,15 +746,11 @@ if uploaded_files and st.button("Perkthe"):
         # Single file logic
         uploaded_file = uploaded_files[0]
         with st.spinner("Translating the certificate..."):
-            resp = textract.analyze_document(
-                Document={'Bytes': uploaded_file.read()},
-                FeatureTypes=["FORMS", "TABLES", "LAYOUT"]
-            )
-            blocks = resp["Blocks"]
-            bmap = {b["Id"]: b for b in blocks}
+            resp = analyze(uploaded_file.read())
+            words, lines, tables, bmap = index_blocks(resp["Blocks"])
 
-            data = extract_table_fields(blocks, bmap)
-            data["Comune"], data["Sezione"] = extract_comune_sezione(blocks)
+            data = extract_table_fields(words, lines, tables, bmap)
+            data["Comune"], data["Sezione"] = extract_comune_sezione(lines)
 
         with st.expander("🔍 Extracted Fields"): st.json(data)
 
@@ -555,39 +761,86 @@ if uploaded_files and st.button("Perkthe"):
         cognome = data.get("Cognome", "Cognome").strip().replace(" ", "_")
         fname = f"{nome}_{cognome}_Certificato_di_Nascita_{today_str}"
 
-        if download_format.startswith("PDF"):
-            st.download_button("📥 Download PDF", doc_buf.getvalue(),
-                               file_name=f"{fname}.pdf", mime="application/pdf")
-        else:
-            st.download_button("📥 Download DOCX", doc_buf.getvalue(),
-                               file_name=f"{fname}.docx",
-                               mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+        try:
+            with st.spinner("Preparing the download..."):
+                out_bytes, mime, ext = render_output(doc_buf.getvalue(), download_format)
+        except (OSError, subprocess.SubprocessError):
+            # no docx2pdf / LibreOffice, or the conversion failed → still serve the DOCX
+            st.error("PDF conversion failed, downloading the Word version instead.")
+            out_bytes, mime, ext = render_output(doc_buf.getvalue(), "Word")
+        st.download_button(f"📥 Download {ext.upper()}", out_bytes,
+                           file_name=f"{fname}.{ext}", mime=mime)
 
     else:
         # Multiple files logic → ZIP
+        # UploadedFile isn't thread-safe: read the bytes here, OCR in the workers
+        payloads = [f.read() for f in uploaded_files]
+
+        def process_one(doc_bytes):
+            resp = analyze(doc_bytes)
+            words, lines, tables, bmap = index_blocks(resp["Blocks"])
+
+            data = extract_table_fields(words, lines, tables, bmap)
+            data["Comune"], data["Sezione"] = extract_comune_sezione(lines)
+
+            doc_buf = make_docx(data)
+
+            today_str = datetime.today().strftime("%d-%m-%Y")
+            nome = data.get("Nome", "Nome").strip().replace(" ", "_")
+            cognome = data.get("Cognome", "Cognome").strip().replace(" ", "_")
+            fname = f"{nome}_{cognome}_Certificato_di_Nascita_{today_str}"
+            return fname, doc_buf.getbuffer()      # memoryview, no copy
+
+        import zipfile
+
+        ext = "pdf" if download_format.startswith("PDF") else "docx"
+        # PDFs compress well; DOCX is already a zip, so those entries are stored
+        stamp = datetime.now().timetuple()[:6]
+
         zip_buffer = BytesIO()
+        # compression is chosen per entry in write_entry (zlib default level)
         with zipfile.ZipFile(zip_buffer, "w") as zipf:
-            for uploaded_file in uploaded_files:
-                with st.spinner(f"Translating {uploaded_file.name}..."):
-                    resp = textract.analyze_document(
-                        Document={'Bytes': uploaded_file.read()},
-                        FeatureTypes=["FORMS", "TABLES", "LAYOUT"]
-                    )
-                    blocks = resp["Blocks"]
-                    bmap = {b["Id"]: b for b in blocks}
-
-                    data = extract_table_fields(blocks, bmap)
-                    data["Comune"], data["Sezione"] = extract_comune_sezione(blocks)
-
-                    doc_buf = make_docx(data)
-
-                    today_str = datetime.today().strftime("%d-%m-%Y")
-                    nome = data.get("Nome", "Nome").strip().replace(" ", "_")
-                    cognome = data.get("Cognome", "Cognome").strip().replace(" ", "_")
-                    fname = f"{nome}_{cognome}_Certificato_di_Nascita_{today_str}"
-
-                    ext = "pdf" if download_format.startswith("PDF") else "docx"
-                    zipf.writestr(f"{fname}.{ext}", doc_buf.getvalue())
+            def write_entry(fname, doc_bytes, ext=ext):
+                info = zipfile.ZipInfo(f"{fname}.{ext}", date_time=stamp)
+                info.compress_type = zipfile.ZIP_DEFLATED if ext == "pdf" else zipfile.ZIP_STORED
+                with zipf.open(info, "w") as zf:
+                    zf.write(doc_bytes)
+
+            progress = st.progress(0.0, text="Translating the certificates...")
+            with ThreadPoolExecutor(max_workers=min(8, len(payloads))) as ex:
+                pending = {ex.submit(process_one, b): i for i, b in enumerate(payloads)}
+                total = len(pending)
+                # streamlit calls and zip writes stay on the script thread.
+                # Results are parked in `ready` by upload index; DOCX entries are
+                # written (and dropped, freeing their buffers) as soon as every
+                # earlier file is in, so the archive keeps the upload order
+                ready, next_idx = {}, 0
+                for done, fut in enumerate(as_completed(pending), 1):
+                    ready[pending.pop(fut)] = fut.result()
+                    if ext == "docx":
+                        while next_idx in ready:
+                            write_entry(*ready.pop(next_idx))
+                            next_idx += 1
+                    progress.progress(done / total, text=f"Translated {done}/{total}")
+            progress.empty()
+
+            # PDF conversion runs on the whole batch, so those DOCX stay in memory
+            results = [ready[i] for i in range(total)] if ext == "pdf" else []
+
+            if ext == "pdf":
+                with st.spinner("Converting to PDF..."):
+                    converted = docx_batch_to_pdf_batch(results)
+                failed = []
+                for (fname, pdf_bytes), (_, docx_bytes) in zip(converted, results):
+                    if pdf_bytes is None:
+                        # keep the translation: ship the DOCX instead
+                        failed.append(fname)
+                        write_entry(fname, docx_bytes, ext="docx")
+                    else:
+                        write_entry(fname, pdf_bytes)
+                if failed:
+                    st.warning("PDF conversion failed for these files, included as DOCX instead:\n"
+                               + "\n".join(f"- {f}" for f in failed))
 
         zip_buffer.seek(0)
         st.download_button(